@@ -2,7 +2,7 @@ import abc
 from abc import abstractmethod
 import six
 
-from typing import Optional, Callable
+from typing import Optional, Callable, List
 
 
 class Cache(six.with_metaclass(abc.ABCMeta)):
@@ -44,6 +44,10 @@ class Cache(six.with_metaclass(abc.ABCMeta)):
         "Tries to get the data from cache."
         raise NotImplementedError()
 
+    def get_many(self, indices: List[int]) -> List[Optional[bytes]]:
+        "Tries to get the data of multiple indices from cache."
+        return [self.get(i) for i in indices]
+
     def get_and_cache(self, i, backend_get: Callable[[int], bytes]) -> bytes:
         '''Get data from cache, otherwise from backend with caching
 
@@ -1,14 +1,68 @@
+import collections
+import contextlib
+import mmap
 import os
-from struct import pack, unpack, calcsize
+import pickle
+import struct
 import threading
 import tempfile
 import warnings
 
 from chainerio import cache
-import pickle
 
-DEFAULT_CACHE_PATH = os.path.join(
-    os.getenv('HOME'), ".chainer", "chainerio", "cache")
+# Resolved at the first FileCache creation when ``None``,
+# as ``~/.chainer/chainerio/cache``
+DEFAULT_CACHE_PATH = None
+# Cache files are anonymous and have no directory entry, so they are
+# created directly in the shared tmpfs without a subdirectory
+TMPFS_CACHE_PATH = "/dev/shm"
+
+# Serializer used when ``do_pickle=True``; any object that has
+# ``dumps`` and ``loads`` such as ``msgpack`` can be used instead
+DEFAULT_CODEC = pickle
+
+# Shared no-op context for DummyLock; use contextlib.nullcontext()
+# when Python 3.6 is dropped.
+_NULL_CONTEXT = contextlib.suppress()
+
+
+def _default_cache_path():
+    global DEFAULT_CACHE_PATH
+    if DEFAULT_CACHE_PATH is None:
+        home = os.environ.get('HOME')
+        if home is None:
+            # $HOME may be unset e.g. in some services and containers;
+            # use a private per-user directory as the temp dir is shared
+            user_dir = os.path.join(tempfile.gettempdir(),
+                                    "chainerio-{}".format(os.getuid()))
+            os.makedirs(user_dir, mode=0o700, exist_ok=True)
+            DEFAULT_CACHE_PATH = os.path.join(user_dir, "cache")
+        else:
+            DEFAULT_CACHE_PATH = os.path.join(
+                home, ".chainer", "chainerio", "cache")
+    return DEFAULT_CACHE_PATH
+
+
+# Upper bound of bytes read at once by merging adjacent regions
+_MAX_READ_SIZE = 4 * 1024 * 1024
+
+
+def _runs(spans, max_size):
+    '''Groups sorted ``(start, stop)`` spans into runs of adjacent ones
+
+    A run is closed once it spans more than ``max_size`` bytes, except
+    that a single span larger than that makes a run by itself.
+
+    '''
+    run = []
+    for span in spans:
+        if run and (run[-1][1] != span[0] or
+                    span[1] - run[0][0] > max_size):
+            yield run
+            run = []
+        run.append(span)
+    if run:
+        yield run
 
 
 class LockContext:
@@ -25,38 +79,50 @@ class LockContext:
 class RWLock:
     '''Reader-writer lock
 
-    TODO(kuenishi): Add unit tests
+    Multiple readers may hold the lock at the same time; the internal
+    condition variable is held only while updating the bookkeeping,
+    not while the lock is held, so readers don't serialize on I/O.
+
+    Writers are preferred: once a writer is waiting, new readers wait
+    until it finishes, so that a stream of readers cannot starve
+    writers. Thus a thread holding the read lock must not take it
+    again while writers may come.
 
     '''
 
     def __init__(self):
         self.cv = threading.Condition()
         self.writer = None
-        self.reader = set()
+        self.reader_count = 0
+        self.writers_waiting = 0
 
     def rdlock(self):
         with self.cv:
-            self.cv.wait_for(lambda: self.writer is None)
-            self.reader.add(threading.get_ident())
+            self.cv.wait_for(lambda: self.writer is None and
+                             self.writers_waiting == 0)
+            self.reader_count += 1
             return LockContext(self)
 
     def wrlock(self):
         with self.cv:
             thread_id = threading.get_ident()
+            self.writers_waiting += 1
             self.cv.wait_for(lambda: self.writer is None and
-                             self.writer != thread_id and
-                             len(self.reader) == 0)
+                             self.reader_count == 0)
+            self.writers_waiting -= 1
             self.writer = thread_id
             return LockContext(self)
 
     def unlock(self):
         with self.cv:
-            thread_id = threading.get_ident()
-            if self.writer == thread_id:
+            if self.writer == threading.get_ident():
                 self.writer = None
+                self.cv.notify_all()
             else:
-                self.reader.remove(thread_id)
-            self.cv.notify_all()
+                self.reader_count -= 1
+                # Only writers wait for readers to leave
+                if self.reader_count == 0:
+                    self.cv.notify_all()
 
 
 class DummyLock:
@@ -67,10 +133,10 @@ class DummyLock:
         pass
 
     def rdlock(self):
-        return LockContext(self)
+        return _NULL_CONTEXT
 
     def wrlock(self):
-        return LockContext(self)
+        return _NULL_CONTEXT
 
     def unlock(self):
         pass
@@ -80,10 +146,25 @@ class FileCache(cache.Cache):
     '''Stores cache data in local filesystem
 
     Stores cache data in local filesystem,
-    ``~/.chainer/chainerio/cache`` by default. Cache data is
-    automatically deleted after the object is collected. If the
-    process quit (typically by SIGTERM) the cache remains after the
-    death of process.
+    ``~/.chainer/chainerio/cache`` by default. Cache files are
+    anonymous (``O_TMPFILE`` on Linux) and have no directory entry, so
+    cache data is released by the kernel once the object is collected
+    or the process dies, even by SIGKILL.
+
+    With ``do_pickle=True``, data is serialized by ``codec``, which is
+    any object with ``dumps`` and ``loads``. It defaults to
+    ``DEFAULT_CODEC``, i.e. ``pickle``, which supports any Python
+    object; a schema-specific codec like ``msgpack`` may be faster
+    for structured data but supports fewer types.
+
+    With ``tmpfs=True``, cache data is stored in ``/dev/shm`` instead
+    of ``dir`` if it is available, to keep data in memory without
+    writeback to disk. Note that it consumes RAM as much as the
+    cached data.
+
+    With ``lru_size > 0``, up to ``lru_size`` recently read entries
+    are also kept in memory, so that ``get`` of hot entries doesn't
+    touch the filesystem.
 
     TODO(kuenishi): retain cache file in case of correct process
     termination and reuse for future process re-invocation.
@@ -91,42 +172,71 @@ class FileCache(cache.Cache):
     '''
 
     def __init__(self, length, multithread_safe=False, do_pickle=False,
-                 dir=DEFAULT_CACHE_PATH, verbose=False):
+                 dir=None, verbose=False, tmpfs=False,
+                 codec=None, lru_size=0):
         self._multithread_safe = multithread_safe
         self.length = length
         self.do_pickle = do_pickle
+        self.codec = DEFAULT_CODEC if codec is None else codec
         assert self.length > 0
 
         if self.multithread_safe:
             self.lock = RWLock()
+            self._lru_lock = threading.Lock()
+            self._pos_lock = threading.Lock()
         else:
             self.lock = DummyLock()
+            self._lru_lock = _NULL_CONTEXT
+            self._pos_lock = _NULL_CONTEXT
+
+        self._lru = collections.OrderedDict()
+        self._lru_size = lru_size
 
         self.pos = 0
+        if dir is None:
+            dir = _default_cache_path()
+        if tmpfs and os.path.isdir(TMPFS_CACHE_PATH):
+            dir = TMPFS_CACHE_PATH
         self.dir = dir
         assert self.dir is not None
         os.makedirs(self.dir, exist_ok=True)
 
         self.closed = False
-        self.indexfp = tempfile.NamedTemporaryFile(delete=True, dir=self.dir)
-        self.indexfile = self.indexfp.name
-        self.datafp = tempfile.NamedTemporaryFile(delete=True, dir=self.dir)
-        self.datafile = self.datafp.name
-
-        # allocate space to store 2n 64bit unsigned integers
-        # 16 bytes * n chunks
+        # TemporaryFile uses O_TMPFILE where supported and falls back
+        # to unlinking the file right after creation otherwise
+        self.indexfp = tempfile.TemporaryFile(buffering=0, dir=self.dir)
+        self.datafp = tempfile.TemporaryFile(buffering=0, dir=self.dir)
+        self._index_fd = self.indexfp.fileno()
+        self._data_fd = self.datafp.fileno()
+        if hasattr(os, 'posix_fadvise'):
+            # Data is read at random; disable readahead
+            os.posix_fadvise(self._data_fd, 0, 0,
+                             os.POSIX_FADV_RANDOM)
+
+        # The index is laid out as two arrays of n 64bit integers,
+        # unsigned offsets followed by signed lengths, where negative
+        # length means an empty slot. Checking whether slots are
+        # populated only touches the lengths.
         # Size must be smaller than max value of signed long long
-        buf = pack('Qq', 0, -1)
-        self.buflen = calcsize('Qq')
-        assert self.buflen == 16
-        for i in range(self.length):
-            offset = self.buflen * i
-            r = os.pwrite(self.indexfp.fileno(), buf, offset)
-            assert r == self.buflen
+        width = struct.calcsize('q')
+        assert width == 8
+        os.ftruncate(self._index_fd, 2 * width * self.length)
+        # Initialize all slots as empty with a single write
+        buf = struct.pack('q', -1) * self.length
+        r = os.pwrite(self._index_fd, buf, width * self.length)
+        assert r == width * self.length
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self._index_fd, 0, 0,
+                             os.POSIX_FADV_WILLNEED)
+        # Map the index to access it without syscalls
+        self._index_mm = mmap.mmap(self._index_fd, 2 * width * self.length)
+        index = memoryview(self._index_mm)
+        self._offsets = index[:width * self.length].cast('Q')
+        self._lengths = index[width * self.length:].cast('q')
+        index.release()
         self.verbose = verbose
         if self.verbose:
-            print('created index file:', self.indexfile)
-            print('created data file:', self.datafile)
+            print('created cache files in:', self.dir)
 
     def __len__(self):
         return self.length
@@ -142,28 +252,136 @@ class FileCache(cache.Cache):
     def get(self, i):
         if self.closed:
             return
-        data = self._get(i)
+        if self._lru_size > 0:
+            data = self._get_with_lru(i)
+        else:
+            data = self._get(i)
         if self.do_pickle and data:
-            data = pickle.loads(data)
+            data = self.codec.loads(data)
         return data
 
     def _get(self, i):
         assert i >= 0 and i < self.length
-        offset = self.buflen * i
         with self.lock.rdlock():
-            buf = os.pread(self.indexfp.fileno(), self.buflen, offset)
-            (o, l) = unpack('Qq', buf)
-            if l < 0 or o < 0:
+            l = self._lengths[i]
+            if l < 0:
                 return None
+            o = self._offsets[i]
+
+            return self._pread_data(l, o)
 
-            data = os.pread(self.datafp.fileno(), l, o)
-            assert len(data) == l
+    def _pread_data(self, size, offset):
+        # pread(2) may return less than requested, e.g. more than
+        # 0x7ffff000 bytes in Linux; retry as well as _put does
+        data = os.pread(self._data_fd, size, offset)
+        if len(data) == size:
             return data
 
+        chunks = [data]
+        read = len(data)
+        while read < size:
+            data = os.pread(self._data_fd, size - read, offset + read)
+            assert len(data) > 0
+            chunks.append(data)
+            read += len(data)
+        return b''.join(chunks)
+
+    def _get_with_lru(self, i):
+        with self._lru_lock:
+            data = self._lru.get(i)
+            if data is not None:
+                self._lru.move_to_end(i)
+                return data
+
+        data = self._get(i)
+        if data is not None:
+            with self._lru_lock:
+                self._lru_put(i, data)
+        return data
+
+    def _lru_put(self, i, data):
+        # Must be called with _lru_lock held
+        self._lru[i] = data
+        self._lru.move_to_end(i)
+        if len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, indices):
+        '''Gets data of multiple indices at once
+
+        Equivalent to ``[self.get(i) for i in indices]``, but takes
+        the lock only once and reads adjacent data regions with a
+        single ``pread(2)``. With ``lru_size > 0``, entries in the
+        in-memory LRU are served from it, and the rest are read
+        from the file and added to it.
+
+        '''
+        indices = list(indices)
+        if self.closed:
+            return [None] * len(indices)
+        if self._lru_size > 0:
+            data = self._get_many_with_lru(indices)
+        else:
+            data = self._get_many(indices)
+        if self.do_pickle:
+            data = [self.codec.loads(d) if d else d for d in data]
+        return data
+
+    def _get_many_with_lru(self, indices):
+        hits = {}
+        with self._lru_lock:
+            for i in indices:
+                data = self._lru.get(i)
+                if data is not None:
+                    self._lru.move_to_end(i)
+                    hits[i] = data
+
+        misses = [i for i in indices if i not in hits]
+        fetched = {}
+        if misses:
+            fetched = dict(zip(misses, self._get_many(misses)))
+            with self._lru_lock:
+                for i, data in fetched.items():
+                    if data is not None:
+                        self._lru_put(i, data)
+
+        return [hits[i] if i in hits else fetched[i] for i in indices]
+
+    def _get_many(self, indices):
+        for i in indices:
+            assert i >= 0 and i < self.length
+
+        with self.lock.rdlock():
+            entries = {i: (self._offsets[i], self._lengths[i])
+                       for i in indices if self._lengths[i] >= 0}
+
+            regions = {}
+            spans = sorted(set((o, o + l) for o, l in entries.values()))
+            for run in _runs(spans, _MAX_READ_SIZE):
+                start, stop = run[0][0], run[-1][1]
+                buf = self._pread_data(stop - start, start)
+                if len(run) == 1:
+                    regions[run[0]] = buf
+                    continue
+                mv = memoryview(buf)
+                for o, end in run:
+                    regions[(o, end)] = bytes(mv[o - start:end - start])
+
+            return [regions[(entries[i][0], sum(entries[i]))]
+                    if i in entries else None for i in indices]
+
     def put(self, i, data):
+        if self.closed:
+            return
+        assert i >= 0 and i < self.length
+        if self._lengths[i] >= 0:
+            # Already data exists. Checked without lock nor
+            # serialization, and checked again under lock in _put
+            return False
+
         try:
             if self.do_pickle:
-                data = pickle.dumps(data)
+                data = self.codec.dumps(data)
             return self._put(i, data)
 
         except OSError as ose:
@@ -175,26 +393,31 @@ class FileCache(cache.Cache):
                 raise ose
 
     def _put(self, i, data):
-        if self.closed:
-            return
         assert i >= 0 and i < self.length
-        offset = self.buflen * i
 
-        with self.lock.wrlock():
-            buf = os.pread(self.indexfp.fileno(), self.buflen, offset)
-            (o, l) = unpack('Qq', buf)
-            if l >= 0 and o >= 0:
+        # Data is written under the shared lock, so that writers to
+        # distinct regions and readers run in parallel, while close()
+        # waits for them. Each writer reserves a private region of the
+        # data file, and only the reservation and publication of the
+        # slot are serialized by ``_pos_lock``.
+        with self.lock.rdlock():
+            if self.closed:
+                return
+            if self._lengths[i] >= 0:
                 # Already data exists
                 return False
 
-            pos = self.pos
+            # Slicing a memoryview on retry doesn't copy the data
+            mv = memoryview(data).cast('B')
+            with self._pos_lock:
+                pos = self.pos
+                self.pos += len(mv)
 
             '''Notes on possibility of partial write
 
             write(3) says partial writes ret<nbyte may happen in
             case nbytes>PIPE_BUF. In Linux 5.0 PIPE_BUF is
-            4096 so partial writes do not happen when writing
-            index, but they may happen when writing data. We
+            4096, so they may happen when writing data. We
             hope it is rare, it seems to happen mostly in case
             of multiple writer processes, disk full and
             ``EINTR``.
@@ -205,19 +428,25 @@ class FileCache(cache.Cache):
             better care that case.
 
             '''
-            buf = pack('Qq', pos, len(data))
-            r = os.pwrite(self.indexfp.fileno(), buf, offset)
-            assert r == self.buflen
-
             current_pos = pos
-            while current_pos - pos < len(data):
-                r = os.pwrite(self.datafp.fileno(),
-                              data[current_pos-pos:], current_pos)
+            while current_pos - pos < len(mv):
+                r = os.pwrite(self._data_fd,
+                              mv[current_pos-pos:], current_pos)
                 assert r > 0
                 current_pos += r
-            assert current_pos - pos == len(data)
-
-            self.pos += len(data)
+            assert current_pos - pos == len(mv)
+
+            # Publish the slot only after the data is fully written,
+            # so that the index never points to a partial region
+            # e.g. when the data write fails with ENOSPC. The length
+            # is set last as it marks the slot populated.
+            with self._pos_lock:
+                if self._lengths[i] >= 0:
+                    # Another writer won the race; the region we
+                    # wrote is left unused
+                    return False
+                self._offsets[i] = pos
+                self._lengths[i] = len(mv)
             return True
 
     def __enter__(self):
@@ -230,7 +459,13 @@ class FileCache(cache.Cache):
         with self.lock.wrlock():
             if not self.closed:
                 self.closed = True
+                self._lru.clear()
+                self._offsets.release()
+                self._lengths.release()
+                self._index_mm.close()
                 self.indexfp.close()
                 self.datafp.close()
                 self.indexfp = None
                 self.datafp = None
+                self._index_fd = -1
+                self._data_fd = -1
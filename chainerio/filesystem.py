@@ -11,5 +11,20 @@ class FileSystem(IO):
                  root: str = ""):
         IO.__init__(self, io_profiler, root)
 
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @root.setter
+    def root(self, root: str) -> None:
+        self._root = root
+        # Precomputed for get_actual_path to skip os.path.join
+        if not root or root.endswith(os.sep):
+            self._root_prefix = root
+        else:
+            self._root_prefix = root + os.sep
+
     def get_actual_path(self, path: str) -> str:
-        return os.path.join(self.root, path)
+        if not self._root_prefix or os.path.isabs(path):
+            return path
+        return self._root_prefix + path
@@ -4,17 +4,12 @@ import os
 from setuptools import setup
 from setuptools import find_packages
 
-package_data = []
-
 proj_dir = os.path.dirname(__file__)
 templates = os.path.join(proj_dir, 'resources', 'templates')
 
-for root, dirs, names in os.walk(templates):
-    for fname in names:
-        abspath = os.path.join(root, fname)
-        relpath = os.path.relpath(proj_dir, abspath)
-        package_data.append(relpath)
-        print(relpath)
+package_data = [os.path.relpath(os.path.join(root, fname), proj_dir)
+                for root, _, names in os.walk(templates)
+                for fname in names]
 
 here = os.path.abspath(os.path.dirname(__file__))
 # Get __version__ variable
@@ -84,3 +84,35 @@ def test_cache_blob(test_class, mt_safe, length):
         data = cache.get(i)
         assert data is not None
         assert _getbin(i) == data
+
+
+@pytest.mark.parametrize("test_class", [NaiveCache, FileCache])
+@pytest.mark.parametrize("mt_safe", [True, False])
+@pytest.mark.parametrize("do_pickle", [True, False])
+def test_cache_get_many(test_class, mt_safe, do_pickle):
+    length = 100
+    cache = test_class(length, multithread_safe=mt_safe, do_pickle=do_pickle)
+
+    def getter(x):
+        if do_pickle:
+            return x * 2
+        return _getbin(x)
+
+    # Leave some holes, and store some slots out of order
+    stored = [i for i in range(length) if i % 7 != 3]
+    stored = stored[10:] + stored[:10]
+    for i in stored:
+        assert cache.put(i, getter(i))
+    if not do_pickle:
+        assert cache.put(3, b'')
+
+    indices = [5, 3, 10, 4, 3, 99, 0, 1, 2] + list(random.sample(
+        range(length), length))
+    expected = [cache.get(i) for i in indices]
+    assert cache.get_many(indices) == expected
+    assert cache.get_many([]) == []
+    for i, data in zip(indices, expected):
+        if i in stored:
+            assert data == getter(i)
+        elif i != 3 or do_pickle:
+            assert data is None
@@ -1,30 +1,176 @@
 from chainerio.cache import FileCache
+import json
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
 
 def test_enospc(monkeypatch):
-    def mock_pread(_fd, _buf, _offset):
+    def mock_pwrite(_fd, _buf, _offset):
         ose = OSError(28, "No space left on device")
         raise ose
-    with monkeypatch.context() as m:
-        m.setattr(os, 'pread', mock_pread)
+    with FileCache(10) as cache:
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pwrite', mock_pwrite)
 
-        with FileCache(10) as cache:
             i = 2
             with pytest.warns(RuntimeWarning):
-                cache.put(i, str(i))
+                cache.put(i, str(i).encode())
 
 
 def test_enoent(monkeypatch):
-    def mock_pread(_fd, _buf, _offset):
+    def mock_pwrite(_fd, _buf, _offset):
         ose = OSError(2, "No such file or directory")
         raise ose
-    with monkeypatch.context() as m:
-        m.setattr(os, 'pread', mock_pread)
+    with FileCache(10) as cache:
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pwrite', mock_pwrite)
+
+            with pytest.raises(OSError):
+                cache.put(4, str(4).encode())
+
+
+def test_enospc_on_data_write(monkeypatch):
+    with FileCache(10) as cache:
+        pwrite = os.pwrite
+
+        def mock_pwrite(fd, data, offset):
+            if fd == cache._data_fd:
+                raise OSError(28, "No space left on device")
+            return pwrite(fd, data, offset)
+
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pwrite', mock_pwrite)
+            with pytest.warns(RuntimeWarning):
+                assert not cache.put(3, b'foo')
 
+        # The slot must stay empty and be writable again
+        assert cache.get(3) is None
+        assert cache.put(3, b'bar')
+        assert cache.get(3) == b'bar'
+
+
+def test_tmpfs():
+    with FileCache(10, tmpfs=True) as cache:
+        if os.path.isdir('/dev/shm'):
+            assert cache.dir == '/dev/shm'
+        assert cache.put(1, b'foo')
+        assert cache.get(1) == b'foo'
+        # Cache files are anonymous and have no directory entry
+        assert os.fstat(cache._index_fd).st_nlink == 0
+        assert os.fstat(cache._data_fd).st_nlink == 0
+
+
+def test_codec():
+    class JSONCodec:
+        def dumps(self, obj):
+            return json.dumps(obj).encode()
+
+        def loads(self, data):
+            return json.loads(data.decode())
+
+    with FileCache(10, do_pickle=True, codec=JSONCodec()) as cache:
+        data = {'foo': [1, 2, 3]}
+        assert cache.put(1, data)
+        assert cache.get(1) == data
+        assert cache.get(2) is None
+
+
+def test_default_dir_without_home(monkeypatch):
+    from chainerio.cache import file_cache
+    with monkeypatch.context() as m:
+        m.delenv('HOME', raising=False)
+        m.setattr(file_cache, 'DEFAULT_CACHE_PATH', None)
         with FileCache(10) as cache:
+            assert cache.dir == os.path.join(
+                tempfile.gettempdir(),
+                'chainerio-{}'.format(os.getuid()), 'cache')
+            st = os.stat(os.path.dirname(cache.dir))
+            assert st.st_uid == os.getuid()
+            assert st.st_mode & 0o777 == 0o700
+            assert cache.put(1, b'foo')
+            assert cache.get(1) == b'foo'
 
-            with pytest.raises(OSError):
-                cache.put(4, str(4))
+
+@pytest.mark.parametrize("mt_safe", [True, False])
+def test_lru(monkeypatch, mt_safe):
+    with FileCache(10, multithread_safe=mt_safe, lru_size=2) as cache:
+        for i in range(4):
+            assert cache.put(i, str(i).encode())
+        for i in range(4):
+            assert cache.get(i) == str(i).encode()
+        # Touch 2 so that 3 is the least recently used
+        assert cache.get(2) == b'2'
+
+        def mock_pread(_fd, _buf, _offset):
+            raise AssertionError("must be read from memory")
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pread', mock_pread)
+            assert cache.get(2) == b'2'
+            assert cache.get(3) == b'3'
+            # Empty slots are not cached but don't need pread either
+            assert cache.get(5) is None
+
+        assert cache.get(0) == b'0'
+        assert list(cache._lru.keys()) == [3, 0]
+
+        # get_many fills the LRU with the misses
+        assert cache.get_many([1, 0, 5]) == [b'1', b'0', None]
+        assert list(cache._lru.keys()) == [0, 1]
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pread', mock_pread)
+            assert cache.get_many([0, 1, 0, 5]) == [b'0', b'1', b'0', None]
+            assert cache.get(1) == b'1'
+
+
+def test_concurrent_put():
+    length = 256
+
+    def getter(i):
+        return str(i).encode() * (i % 7)
+
+    with FileCache(length, multithread_safe=True) as cache, \
+            ThreadPoolExecutor(max_workers=8) as pool:
+        # Every slot is put by multiple threads at once
+        indices = list(range(length)) * 4
+        results = list(pool.map(lambda i: cache.put(i, getter(i)), indices))
+        assert sum(results) == length
+
+        for i in range(length):
+            assert cache.get(i) == getter(i)
+
+
+def test_get_many_short_read(monkeypatch):
+    from chainerio.cache import file_cache
+    pread = os.pread
+    sizes = []
+
+    def mock_pread(fd, size, offset):
+        # Return at most 5 bytes at once, like a partial read
+        sizes.append(size)
+        return pread(fd, min(size, 5), offset)
+
+    with FileCache(10) as cache:
+        for i in range(10):
+            assert cache.put(i, str(i).encode() * 4)
+        expected = [str(i).encode() * 4 for i in range(10)]
+
+        with monkeypatch.context() as m:
+            m.setattr(os, 'pread', mock_pread)
+            m.setattr(file_cache, '_MAX_READ_SIZE', 10)
+            assert cache.get_many(range(10)) == expected
+            assert cache.get(3) == b'3333'
+
+        # Adjacent regions are merged up to _MAX_READ_SIZE bytes
+        assert max(sizes) <= 10
+        assert len(sizes) > 10
+
+
+def test_get_many_iterable():
+    with FileCache(10) as cache:
+        for i in range(10):
+            assert cache.put(i, str(i).encode())
+        assert cache.get_many(i for i in range(3)) == [b'0', b'1', b'2']
+        assert cache.get_many(iter([])) == []
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from chainerio.cache.file_cache import RWLock
+
+
+def test_shared_readers():
+    lock = RWLock()
+    n = 4
+    barrier = threading.Barrier(n, timeout=10)
+
+    def reader():
+        with lock.rdlock():
+            # Deadlocks (and times out) unless all readers hold the
+            # lock at the same time
+            barrier.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+
+
+def test_exclusive_writer():
+    lock = RWLock()
+    entered = threading.Event()
+
+    def reader():
+        with lock.rdlock():
+            entered.set()
+
+    with lock.wrlock():
+        t = threading.Thread(target=reader)
+        t.start()
+        assert not entered.wait(0.1)
+
+    t.join()
+    assert entered.is_set()
+
+
+def test_nested_rdlock():
+    lock = RWLock()
+    with lock.rdlock():
+        with lock.rdlock():
+            assert lock.reader_count == 2
+        assert lock.reader_count == 1
+    assert lock.reader_count == 0
+
+    with lock.wrlock():
+        assert lock.writer == threading.get_ident()
+    assert lock.writer is None
+
+
+def test_writer_preference():
+    lock = RWLock()
+    order = []
+
+    def writer():
+        with lock.wrlock():
+            order.append('writer')
+
+    def reader():
+        with lock.rdlock():
+            order.append('reader')
+
+    with lock.rdlock():
+        w = threading.Thread(target=writer)
+        w.start()
+        while lock.writers_waiting == 0:
+            time.sleep(0.001)
+
+        # A new reader must not overtake the waiting writer
+        r = threading.Thread(target=reader)
+        r.start()
+        r.join(0.1)
+        assert r.is_alive()
+
+    w.join()
+    r.join()
+    assert order == ['writer', 'reader']
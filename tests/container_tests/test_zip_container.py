@@ -5,34 +5,44 @@ import io
 import os
 import pickle
 import shutil
+import tempfile
 from zipfile import ZipFile
 
 
 class TestZipHandler(unittest.TestCase):
 
-    def setUp(self):
+    test_string = "this is a test string\n"
+    dir_name = "testdir/"
+    zipped_file_name = "testfile"
+
+    @classmethod
+    def setUpClass(cls):
+        # Build the zip on memory once and share it among the tests
+        cls.zipped_file_path = os.path.join(
+            cls.dir_name, cls.zipped_file_name)
+        cls._buf = io.BytesIO()
+        with ZipFile(cls._buf, "w") as z:
+            z.writestr(cls.dir_name, "")
+            z.writestr(cls.zipped_file_path, cls.test_string)
+
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.zip_file_path = cls._write_zip("test.zip", cls._buf)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @classmethod
+    def _write_zip(cls, name, buf):
+        path = os.path.join(cls.tmpdir, name)
+        with open(path, "wb") as f:
+            f.write(buf.getvalue())
+        return path
 
-        self.test_string = "this is a test string\n"
+    def setUp(self):
         self.test_string_b = self.test_string.encode("utf-8")
-        self.zip_file_name = "test"
-        self.zip_file_path = self.zip_file_name + ".zip"
-        self.dir_name = "testdir/"
-        self.zipped_file_name = "testfile"
-        self.zipped_file_path = os.path.join(
-            self.dir_name, self.zipped_file_name)
         self.fs_handler = chainerio.create_handler("posix")
 
-        os.mkdir(self.dir_name)
-        with open(self.zipped_file_path, "w") as tmpfile:
-            tmpfile.write(self.test_string)
-
-        shutil.make_archive(self.zip_file_name, "zip", base_dir=self.dir_name)
-
-    def tearDown(self):
-        os.remove(self.zipped_file_path)
-        os.remove(self.zip_file_path)
-        os.rmdir(self.dir_name)
-
     def test_read_bytes(self):
         with self.fs_handler.open_as_container(
                 os.path.abspath(self.zip_file_path)) as handler:
@@ -95,22 +105,17 @@ class TestZipHandler(unittest.TestCase):
         pickle_file_name = "test_pickle.pickle"
         test_data = {'test_elem1': b'balabala',
                      'test_elem2': 'balabala'}
-        pickle_zip = "test_pickle.zip"
-
-        with open(pickle_file_name, "wb") as f:
-            pickle.dump(test_data, f)
 
-        with ZipFile(pickle_zip, "w") as test_zip:
-            test_zip.write(pickle_file_name)
+        buf = io.BytesIO()
+        with ZipFile(buf, "w") as test_zip:
+            test_zip.writestr(pickle_file_name, pickle.dumps(test_data))
+        pickle_zip = self._write_zip("test_pickle.zip", buf)
 
         with self.fs_handler.open_as_container(pickle_zip) as handler:
             with handler.open(pickle_file_name, 'rb') as f:
                 loaded_obj = pickle.load(f)
                 self.assertEqual(test_data, loaded_obj)
 
-        os.remove(pickle_file_name)
-        os.remove(pickle_zip)
-
     def test_exists(self):
         non_exist_file = "non_exist_file.txt"
 
@@ -159,6 +159,14 @@ class TestPosixHandler(unittest.TestCase):
         # TODO(tianqi) add test after we well defined the stat
         pass
 
+    def test_get_actual_path(self):
+        with chainerio.create_handler(self.fs) as handler:
+            for root in ["", "/", "/tmp", "/tmp/", "tmp", "tmp/foo/"]:
+                handler.root = root
+                for path in ["", "bar", "bar/baz", "/bar"]:
+                    self.assertEqual(os.path.join(root, path),
+                                     handler.get_actual_path(path))
+
 
 if __name__ == '__main__':
     unittest.main()